@@ -1,14 +1,25 @@
 # main.py
 import os
-import re
+import sys
+import json
+import random
+import time
+import sqlite3
+import hashlib
+import threading
+import codecs
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Awaitable, Union, Literal
 from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.datastructures import Headers
+from pydantic import BaseModel, ConfigDict
+from verilog_analyzer import VerilogAnalyzer
 import httpx
-import json
+import orjson
 import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 # ========= Config =========
@@ -16,7 +27,35 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise RuntimeError("GEMINI_API_KEY not set in .env file")
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+GEMINI_MODEL = "gemini-2.0-flash"
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+GEMINI_API_URL = f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:generateContent"
+GEMINI_STREAM_URL = f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:streamGenerateContent"
+# Rate limiting and transient upstream failures are retried with backoff
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_RETRY_DELAY_SECONDS = 30.0
+# Output budget per endpoint; generation time grows with output length, so don't
+# let short-answer endpoints run to the model maximum
+DEFAULT_MAX_OUTPUT_TOKENS = 8192
+MAX_OUTPUT_TOKENS = {
+    "chat": 1024,
+    "generate": 4096,
+    "debug": 4096,
+    "optimize": 4096,
+    "testbench": 8192,
+    "explain": 2048,
+    "analyze": 2048,
+}
+# Request bodies are pre-encoded with orjson, so the content type is set explicitly
+JSON_HEADERS = {"Content-Type": "application/json"}
+CACHE_DB_PATH = os.getenv("VERILOGAI_CACHE_DB", "verilogai_cache.sqlite3")
+CACHE_TTL_SECONDS = int(os.getenv("VERILOGAI_CACHE_TTL", "86400"))
+CACHE_MAX_ROWS = int(os.getenv("VERILOGAI_CACHE_MAX_ROWS", "10000"))
+MAX_UPLOAD_BYTES = int(os.getenv("VERILOGAI_MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+SERVER_WORKERS = int(os.getenv("VERILOGAI_WORKERS", os.cpu_count() or 1))
+# Reported by /health; formatted once instead of on every probe
+STARTUP_TIME = datetime.now().isoformat()
 
 # ========= Enhanced System Prompts =========
 SYSTEM_BASE = (
@@ -83,13 +122,255 @@ SYSTEM_OPTIMIZE = (
     "Provide before/after comparisons and implementation trade-offs."
 )
 
+SYSTEM_ANALYZE = SYSTEM_BASE + "\nProvide detailed technical analysis without modifying the code."
+
+SYSTEM_EXPLAIN = SYSTEM_BASE + "\nProvide clear, educational explanations suitable for learning."
+
+# ========= User Message Templates =========
+OPTIMIZATION_GUIDANCE = {
+    "area": "Prioritize resource sharing and logic minimization",
+    "speed": "Focus on reducing critical path delay and maximizing clock frequency",
+    "power": "Implement clock gating and minimize switching activity",
+    "balanced": "Balance area, timing, and power considerations"
+}
+
+TARGET_GUIDANCE = {
+    "fpga": "Optimize for FPGA resources (LUTs, FFs, BRAMs, DSPs)",
+    "asic": "Consider standard cell libraries and manufacturing constraints",
+    "generic": "Write portable, synthesis-friendly code"
+}
+
+GENERATE_TEMPLATE = """Generate a {language} module from this specification.
+
+Requirements:
+- Target: {target} ({target_guidance})
+- Optimization: {optimization} ({optimization_guidance})
+- Include assertions: {include_assertions}
+- Include coverage: {include_coverage}
+
+Additional guidelines:
+- Use proper reset methodology
+- Include comprehensive comments
+- Add parameter documentation
+- Provide instantiation template
+- Consider testability (DFT)
+
+Specification:
+{spec}"""
+
+DEBUG_TEMPLATE = """Analyze and debug the following Verilog code.
+Analysis depth: {analysis_depth}
+
+Provide:
+1. Critical issues (synthesis blockers)
+2. Warnings (potential problems)
+3. Style improvements
+4. Corrected code with explanations
+
+Code:
+{code}"""
+
+OPTIMIZE_TEMPLATE = """Optimize the following Verilog code for {target} implementation.
+Objective: {objective}
+{constraints_text}
+
+Provide:
+1. Current design analysis (area, timing, power estimates)
+2. Optimization opportunities
+3. Optimized code with detailed explanations
+4. Trade-off analysis
+5. Implementation recommendations
+
+Code:
+{code}"""
+
+TESTBENCH_TEMPLATE = """Generate a comprehensive {language} testbench.
+
+DUT Analysis:
+DUT modules: {dut_modules}
+
+Requirements:
+- Test type: {test_type}
+- Include coverage: {include_coverage}
+- Language: {language}
+
+Generate:
+1. Testbench architecture with proper interfaces
+2. Clock and reset generation
+3. Stimulus generation (directed + random)
+4. Self-checking mechanisms
+5. Coverage collection
+6. Performance metrics
+7. Test report generation
+
+DUT Code:
+{dut_code}"""
+
+ANALYZE_TEMPLATE = """Provide a comprehensive analysis of this Verilog code:
+
+Metrics:
+- Lines of code: {loc}
+
+Analysis areas:
+1. Design complexity and maintainability
+2. Synthesis implications and resource usage
+3. Timing considerations
+4. Power implications
+5. Verification challenges
+6. Industry best practices compliance
+7. Portability across tools/vendors
+
+Code:
+{code}"""
+
+EXPLAIN_TEMPLATE = """Explain this Verilog code for a {analysis_depth} level understanding.
+
+Code context:
+- Complexity: {complexity}
+
+Structure your explanation:
+1. Overview and purpose
+2. Module interface (ports and parameters)
+3. Internal architecture
+4. Key design decisions
+5. Timing and clocking
+6. Reset methodology
+7. Potential applications
+8. Learning points for students
+
+Code:
+{code}"""
+
+# Sent as a second user turn after the main prompt by /debug, /analyze and /explain
+STATIC_ANALYSIS_TEMPLATE = """Static Analysis Results:
+- Modules found: {modules}
+- Clock domains: {clocks}
+- Style issues: {style_issues} found"""
+
+# ========= Response Cache =========
+class ResponseCache:
+    """SQLite-backed cache of Gemini replies, namespaced per endpoint.
+
+    Lookups try an exact hash of the prompt first, then a hash of the prompt
+    with whitespace collapsed within each line, so re-indented repeats also hit.
+    Line breaks and case are kept: replies quote line numbers and Verilog
+    identifiers are case-sensitive.
+
+    Methods do blocking SQLite I/O; async callers run them via asyncio.to_thread.
+    """
+
+    def __init__(self, path: str, ttl: int, max_rows: int):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets several uvicorn worker processes read while one writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "namespace TEXT NOT NULL, exact_key TEXT NOT NULL, norm_key TEXT NOT NULL, "
+            "reply TEXT NOT NULL, expires_at REAL NOT NULL, "
+            "PRIMARY KEY (namespace, exact_key))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_norm ON responses (namespace, norm_key)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_expires ON responses (expires_at)")
+        self._prune()
+        self.conn.commit()
+
+    @staticmethod
+    def _keys(messages: List[Dict[str, str]]) -> Tuple[str, str]:
+        text = "\x1e".join(f"{m['role']}\x1f{m['content']}" for m in messages)
+        normalized = "\n".join(" ".join(line.split()) for line in text.split("\n"))
+        return (
+            hashlib.blake2b(text.encode(), digest_size=16).hexdigest(),
+            hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest(),
+        )
+
+    def get(self, namespace: str, messages: List[Dict[str, str]]) -> Optional[str]:
+        exact_key, norm_key = self._keys(messages)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT reply FROM responses WHERE namespace = ? AND expires_at > ? "
+                "AND (exact_key = ? OR norm_key = ?) ORDER BY exact_key = ? DESC LIMIT 1",
+                (namespace, time.time(), exact_key, norm_key, exact_key),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, namespace: str, messages: List[Dict[str, str]], reply: str) -> None:
+        exact_key, norm_key = self._keys(messages)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (namespace, exact_key, norm_key, reply, time.time() + self.ttl),
+            )
+            self._prune()
+            self.conn.commit()
+
+    def _prune(self) -> None:
+        """Drop expired rows, then the soonest-to-expire rows beyond max_rows"""
+        self.conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        self.conn.execute(
+            "DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY expires_at "
+            "LIMIT max(0, (SELECT COUNT(*) FROM responses) - ?))",
+            (self.max_rows,),
+        )
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+# ========= Shared HTTP client =========
+# One pooled client per process so Gemini calls reuse keep-alive connections
+# instead of paying a fresh TCP+TLS handshake on every request. The API key is
+# attached once as a default query param rather than interpolated per call.
+http_client: Optional[httpx.AsyncClient] = None
+response_cache: Optional[ResponseCache] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client, response_cache
+    http_client = httpx.AsyncClient(
+        http2=True,
+        params={"key": GEMINI_API_KEY},
+        timeout=httpx.Timeout(120.0, connect=5.0),
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+    )
+    response_cache = ResponseCache(CACHE_DB_PATH, CACHE_TTL_SECONDS, CACHE_MAX_ROWS)
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+        http_client = None
+        response_cache.close()
+        response_cache = None
+
 # ========= FastAPI app =========
 app = FastAPI(
     title="VerilogAI - Enhanced Backend",
     description="Advanced Verilog/SystemVerilog design assistant with comprehensive analysis capabilities",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
+class RequestBodyLimitMiddleware:
+    """Refuse bodies that declare a size over the upload limit before Starlette reads them"""
+    # Plain ASGI rather than an "http" middleware so other requests pay no BaseHTTPMiddleware cost.
+    # Headroom covers multipart framing around an upload of exactly MAX_UPLOAD_BYTES.
+    # Chunked bodies carry no Content-Length; a reverse proxy limit is what caps those.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            content_length = Headers(scope=scope).get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE:
+                response = JSONResponse(status_code=413, content={"detail": f"Request body exceeds the {MAX_UPLOAD_BYTES} byte limit"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Added first so CORSMiddleware wraps it and its 413s still carry CORS headers
+app.add_middleware(RequestBodyLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://localhost:3000", "http://127.0.0.1:3000", "http://127.0.0.1:8000"],
@@ -99,149 +380,208 @@ app.add_middleware(
 )
 
 # ========= Enhanced Request Models =========
-class ChatRequest(BaseModel):
+# Enum-like fields are Literals so invalid values are rejected with a 422 during validation
+HdlLanguage = Literal["verilog2001", "systemverilog"]
+
+class RequestModel(BaseModel):
+    # Request bodies are read-only inputs; unknown keys are dropped rather than validated
+    model_config = ConfigDict(extra='ignore', frozen=True)
+
+class ChatRequest(RequestModel):
     prompt: str
-    history: Optional[List[Dict[str, str]]] = None
+    history: Optional[list[dict[str, str]]] = None
     context: Optional[str] = None  # Additional context for specialized queries
+    stream: bool = False  # Stream the reply as server-sent events
 
-class GenerateRequest(BaseModel):
+class GenerateRequest(RequestModel):
     spec: str
-    language: str = Field(default="systemverilog", description="verilog2001 or systemverilog")
-    target: str = Field(default="generic", description="fpga, asic, or generic")
-    optimization: str = Field(default="balanced", description="area, speed, power, or balanced")
-    include_assertions: bool = Field(default=True)
-    include_coverage: bool = Field(default=False)
-
-class CodeRequest(BaseModel):
+    language: HdlLanguage = "systemverilog"
+    target: Literal["fpga", "asic", "generic"] = "generic"
+    optimization: Literal["area", "speed", "power", "balanced"] = "balanced"
+    include_assertions: bool = True
+    include_coverage: bool = False
+    stream: bool = False  # Stream the reply as server-sent events
+
+class CodeRequest(RequestModel):
     code: str
     file_name: Optional[str] = None
-    analysis_depth: str = Field(default="standard", description="basic, standard, or comprehensive")
+    analysis_depth: Literal["basic", "standard", "comprehensive"] = "standard"
+    stream: bool = False  # Stream the reply as server-sent events
 
-class OptimizeRequest(BaseModel):
+class OptimizeRequest(RequestModel):
     code: str
-    target: str = Field(default="fpga", description="fpga or asic")
-    objective: str = Field(default="balanced", description="area, timing, power, or balanced")
-    constraints: Optional[Dict[str, Any]] = None
+    target: Literal["fpga", "asic"] = "fpga"
+    objective: Literal["area", "timing", "power", "balanced"] = "balanced"
+    constraints: Optional[dict[str, Any]] = None
+    stream: bool = False  # Stream the reply as server-sent events
 
-class TestbenchRequest(BaseModel):
+class TestbenchRequest(RequestModel):
     dut_code: str
-    test_type: str = Field(default="comprehensive", description="basic, comprehensive, or performance")
-    language: str = Field(default="systemverilog")
-    include_coverage: bool = Field(default=True)
-
-# ========= Enhanced Verilog Analysis Functions =========
-class VerilogAnalyzer:
-    @staticmethod
-    def extract_modules(code: str) -> List[Dict[str, str]]:
-        """Extract module information from Verilog code"""
-        modules = []
-        module_pattern = r'module\s+(\w+)\s*(?:#\([^)]*\))?\s*\(([^;]*)\);'
-        matches = re.finditer(module_pattern, code, re.MULTILINE | re.DOTALL)
-        
-        for match in matches:
-            modules.append({
-                'name': match.group(1),
-                'ports': match.group(2).strip(),
-                'start_pos': match.start(),
-                'end_pos': match.end()
-            })
-        return modules
+    test_type: Literal["basic", "comprehensive", "performance"] = "comprehensive"
+    language: HdlLanguage = "systemverilog"
+    include_coverage: bool = True
+    stream: bool = False  # Stream the reply as server-sent events
 
-    @staticmethod
-    def analyze_clock_domains(code: str) -> List[str]:
-        """Identify clock domains in the code"""
-        clock_signals = set()
-        # Look for common clock patterns
-        patterns = [
-            r'always_ff\s*@\s*\(\s*posedge\s+(\w+)',
-            r'always\s*@\s*\(\s*posedge\s+(\w+)',
-            r'always_ff\s*@\s*\(\s*negedge\s+(\w+)',
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, code)
-            clock_signals.update(matches)
-        
-        return list(clock_signals)
+# ========= Enhanced Gemini API Helper =========
+def build_gemini_payload(messages: List[Dict[str, str]],
+                         max_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS) -> Dict[str, Any]:
+    """Build a generateContent payload from chat-style messages"""
+    contents = []
+    for msg in messages:
+        role = "user" if msg["role"] == "user" else "model"
+        contents.append({
+            "role": role,
+            "parts": [{"text": msg["content"]}]
+        })
+    
+    payload = {
+        "contents": contents,
+        "generationConfig": {
+            "temperature": 0.1,  # Lower temperature for more consistent technical responses
+            "maxOutputTokens": max_tokens,
+            "topP": 0.8,
+            "topK": 40
+        }
+    }
+    return payload
 
-    @staticmethod
-    def check_coding_style(code: str) -> List[Dict[str, str]]:
-        """Check for coding style violations"""
-        issues = []
-        lines = code.split('\n')
-        
-        for i, line in enumerate(lines, 1):
-            # Check for blocking assignments in sequential blocks
-            if 'always_ff' in line or 'always @(posedge' in line:
-                if '=' in line and '<=' not in line and '//' not in line.split('=')[0]:
-                    issues.append({
-                        'type': 'warning',
-                        'line': i,
-                        'message': 'Consider using non-blocking assignment (<=) in sequential logic'
-                    })
-            
-            # Check for magic numbers
-            if re.search(r'\b\d{2,}\b', line) and 'parameter' not in line and '//' not in line:
-                issues.append({
-                    'type': 'info',
-                    'line': i,
-                    'message': 'Consider using parameters for numeric constants'
-                })
-        
-        return issues
+def retry_delay(attempt: int, resp: Optional[httpx.Response] = None) -> float:
+    """Seconds to wait before the next attempt: the server's Retry-After when given,
+    otherwise exponential backoff, plus jitter so concurrent clients don't retry in lockstep"""
+    delay = 2 ** attempt
+    if resp is not None and "Retry-After" in resp.headers:
+        try:
+            delay = float(resp.headers["Retry-After"])
+        except ValueError:  # HTTP-date form; keep the exponential delay
+            pass
+    return min(delay, MAX_RETRY_DELAY_SECONDS) + random.uniform(0, 0.5)
+
+# The response cache is best-effort: SQLite errors ("database is locked" between workers,
+# a full disk) count as a miss or a skipped write, never as a failed request
+async def cache_lookup(namespace: Optional[str], messages: List[Dict[str, str]]) -> Optional[str]:
+    """Cached reply for these messages, or None on a miss or cache error"""
+    if not (namespace and response_cache):
+        return None
+    try:
+        return await asyncio.to_thread(response_cache.get, namespace, messages)
+    except sqlite3.Error:
+        return None
+
+async def cache_store(namespace: Optional[str], messages: List[Dict[str, str]], reply: str) -> None:
+    """Store a reply, silently skipping the write if the cache is unavailable"""
+    if not (namespace and response_cache):
+        return
+    try:
+        await asyncio.to_thread(response_cache.set, namespace, messages, reply)
+    except sqlite3.Error:
+        pass
 
-# ========= Enhanced Gemini API Helper =========
-async def call_gemini_with_retry(messages: List[Dict[str, str]], max_retries: int = 3) -> str:
+async def call_gemini_with_retry(messages: List[Dict[str, str]], max_retries: int = 3,
+                                 cache_namespace: Optional[str] = None,
+                                 max_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS) -> str:
     """Enhanced Gemini API call with retry logic and better error handling"""
+    cached = await cache_lookup(cache_namespace, messages)
+    if cached is not None:
+        return cached
+    
     for attempt in range(max_retries):
         try:
-            contents = []
-            for msg in messages:
-                role = "user" if msg["role"] == "user" else "model"
-                contents.append({
-                    "role": role,
-                    "parts": [{"text": msg["content"]}]
-                })
-            
-            payload = {
-                "contents": contents,
-                "generationConfig": {
-                    "temperature": 0.1,  # Lower temperature for more consistent technical responses
-                    "maxOutputTokens": 8192,
-                    "topP": 0.8,
-                    "topK": 40
-                }
-            }
-            
-            url = f"{GEMINI_API_URL}?key={GEMINI_API_KEY}"
-            headers = {"Content-Type": "application/json"}
+            payload = build_gemini_payload(messages, max_tokens)
             
-            async with httpx.AsyncClient(timeout=120) as client:
-                resp = await client.post(url, headers=headers, data=json.dumps(payload))
+            resp = await http_client.post(GEMINI_API_URL, content=orjson.dumps(payload), headers=JSON_HEADERS)
             
             if resp.status_code == 200:
-                data = resp.json()
-                return data["candidates"][0]["content"]["parts"][0]["text"]
-            elif resp.status_code == 429:  # Rate limit
+                data = orjson.loads(resp.content)
+                candidate = data["candidates"][0]
+                reply = candidate["content"]["parts"][0]["text"]
+                # Truncated (MAX_TOKENS) or filtered replies are returned but never cached
+                if candidate.get("finishReason") == "STOP":
+                    await cache_store(cache_namespace, messages, reply)
+                return reply
+            elif resp.status_code in RETRYABLE_STATUS_CODES:  # Rate limit or transient server error
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                    await asyncio.sleep(retry_delay(attempt, resp))
                     continue
             
             raise HTTPException(status_code=resp.status_code, detail=resp.text)
             
+        except HTTPException:
+            # Non-retryable API error (or retries exhausted); retrying won't change the answer
+            raise
         except Exception as e:
             if attempt == max_retries - 1:
                 raise HTTPException(status_code=500, detail=f"API call failed after {max_retries} attempts: {str(e)}")
-            await asyncio.sleep(1)
+            await asyncio.sleep(retry_delay(attempt))
+
+async def stream_gemini(messages: List[Dict[str, str]], cache_namespace: Optional[str] = None,
+                        max_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS) -> AsyncIterator[str]:
+    """Yield reply text as Gemini generates it (streamGenerateContent over SSE)"""
+    cached = await cache_lookup(cache_namespace, messages)
+    if cached is not None:
+        yield cached
+        return
+    
+    payload = build_gemini_payload(messages, max_tokens)
+    chunks = []
+    finish_reason = None
+    async with http_client.stream("POST", GEMINI_STREAM_URL, params={"alt": "sse"},
+                                  content=orjson.dumps(payload), headers=JSON_HEADERS) as resp:
+        if resp.status_code != 200:
+            raise HTTPException(status_code=resp.status_code, detail=(await resp.aread()).decode())
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = orjson.loads(line[5:])
+            for candidate in data.get("candidates", [])[:1]:
+                finish_reason = candidate.get("finishReason", finish_reason)
+                for part in candidate.get("content", {}).get("parts", []):
+                    text = part.get("text")
+                    if text:
+                        chunks.append(text)
+                        yield text
+    
+    # Only a complete reply is worth replaying; an empty, truncated or filtered one is not
+    if chunks and finish_reason == "STOP":
+        await cache_store(cache_namespace, messages, "".join(chunks))
+
+def sse_response(chunks: AsyncIterator[str],
+                 extra: Union[Dict[str, Any], Awaitable[Dict[str, Any]]]) -> StreamingResponse:
+    """Relay reply chunks as `data:` events, then the endpoint's other fields as a final `done` event"""
+    extra_task = extra if isinstance(extra, dict) else asyncio.ensure_future(extra)
+    
+    async def events():
+        try:
+            async for text in chunks:
+                yield b"data: " + orjson.dumps({"text": text}) + b"\n\n"
+            done = extra_task if isinstance(extra_task, dict) else await extra_task
+            yield b"event: done\ndata: " + orjson.dumps(done) + b"\n\n"
+        except Exception as e:
+            yield b"event: error\ndata: " + orjson.dumps({"detail": str(e)}) + b"\n\n"
+        finally:
+            if not isinstance(extra_task, dict):
+                extra_task.cancel()
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+async def static_analysis_turn(code: str) -> Tuple[Dict[str, str], Tuple[List[Dict[str, str]], List[str], List[Dict[str, str]]]]:
+    """Scan the code (memoized, off the event loop) and summarize it as a follow-up user turn"""
+    modules, clocks, style_issues = await asyncio.to_thread(VerilogAnalyzer.scan, code)
+    # Clock domains come from a set; sort them so identical code always yields an identical prompt
+    summary = STATIC_ANALYSIS_TEMPLATE.format(
+        modules=[m['name'] for m in modules],
+        clocks=sorted(clocks),
+        style_issues=len(style_issues),
+    )
+    return {"role": "user", "content": summary}, (modules, clocks, style_issues)
 
 # ========= Enhanced Routes =========
 @app.get("/health")
 async def health():
     return {
         "status": "ok",
-        "timestamp": datetime.now().isoformat(),
+        "started_at": STARTUP_TIME,
         "version": "2.0.0",
-        "features": ["generate", "debug", "explain", "optimize", "testbench", "analyze"]
+        "features": ["generate", "debug", "explain", "optimize", "testbench", "analyze", "full_review"]
     }
 
 @app.post("/chat")
@@ -257,100 +597,75 @@ async def chat(req: ChatRequest):
         
         messages.append({"role": "user", "content": req.prompt})
         
-        reply = await call_gemini_with_retry(messages=messages)
-        return {"reply": reply, "timestamp": datetime.now().isoformat()}
+        if req.stream:
+            return sse_response(stream_gemini(messages, cache_namespace="chat",
+                                              max_tokens=MAX_OUTPUT_TOKENS["chat"]),
+                                {"timestamp": time.time()})
+        
+        reply = await call_gemini_with_retry(messages=messages, cache_namespace="chat",
+                                             max_tokens=MAX_OUTPUT_TOKENS["chat"])
+        return {"reply": reply, "timestamp": time.time()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/generate")
 async def generate(req: GenerateRequest):
     try:
-        optimization_guidance = {
-            "area": "Prioritize resource sharing and logic minimization",
-            "speed": "Focus on reducing critical path delay and maximizing clock frequency",
-            "power": "Implement clock gating and minimize switching activity",
-            "balanced": "Balance area, timing, and power considerations"
-        }
+        user_msg = GENERATE_TEMPLATE.format(
+            language=req.language,
+            target=req.target,
+            target_guidance=TARGET_GUIDANCE[req.target],
+            optimization=req.optimization,
+            optimization_guidance=OPTIMIZATION_GUIDANCE[req.optimization],
+            include_assertions=req.include_assertions,
+            include_coverage=req.include_coverage,
+            spec=req.spec,
+        )
+
+        messages = [
+            {"role": "system", "content": SYSTEM_GENERATE},
+            {"role": "user", "content": user_msg},
+        ]
+        metadata = {"language": req.language, "target": req.target}
         
-        target_guidance = {
-            "fpga": "Optimize for FPGA resources (LUTs, FFs, BRAMs, DSPs)",
-            "asic": "Consider standard cell libraries and manufacturing constraints",
-            "generic": "Write portable, synthesis-friendly code"
-        }
+        if req.stream:
+            return sse_response(stream_gemini(messages, cache_namespace="generate",
+                                              max_tokens=MAX_OUTPUT_TOKENS["generate"]),
+                                {"metadata": metadata})
         
-        user_msg = f"""Generate a {req.language} module from this specification.
-
-Requirements:
-- Target: {req.target} ({target_guidance[req.target]})
-- Optimization: {req.optimization} ({optimization_guidance[req.optimization]})
-- Include assertions: {req.include_assertions}
-- Include coverage: {req.include_coverage}
-
-Additional guidelines:
-- Use proper reset methodology
-- Include comprehensive comments
-- Add parameter documentation
-- Provide instantiation template
-- Consider testability (DFT)
-
-Specification:
-{req.spec}"""
-
-        reply = await call_gemini_with_retry(
-            messages=[
-                {"role": "system", "content": SYSTEM_GENERATE},
-                {"role": "user", "content": user_msg},
-            ]
-        )
-        return {"reply": reply, "metadata": {"language": req.language, "target": req.target}}
+        reply = await call_gemini_with_retry(messages=messages, cache_namespace="generate",
+                                             max_tokens=MAX_OUTPUT_TOKENS["generate"])
+        return {"reply": reply, "metadata": metadata}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/debug")
 async def debug(req: CodeRequest):
     try:
-        # Perform static analysis
-        analyzer = VerilogAnalyzer()
-        modules = analyzer.extract_modules(req.code)
-        clocks = analyzer.analyze_clock_domains(req.code)
-        style_issues = analyzer.check_coding_style(req.code)
-        
-        analysis_context = f"""
-Static Analysis Results:
-- Modules found: {[m['name'] for m in modules]}
-- Clock domains: {clocks}
-- Style issues: {len(style_issues)} found
-"""
-        
-        user_msg = f"""Analyze and debug the following {req.language if hasattr(req, 'language') else 'Verilog'} code.
-Analysis depth: {req.analysis_depth}
-
-{analysis_context}
-
-Provide:
-1. Critical issues (synthesis blockers)
-2. Warnings (potential problems)  
-3. Style improvements
-4. Corrected code with explanations
+        user_msg = DEBUG_TEMPLATE.format(analysis_depth=req.analysis_depth, code=req.code)
 
-Code:
-{req.code}"""
-
-        reply = await call_gemini_with_retry(
-            messages=[
-                {"role": "system", "content": SYSTEM_DEBUG},
-                {"role": "user", "content": user_msg},
-            ]
-        )
-        
-        return {
-            "reply": reply,
+        analysis_msg, (modules, clocks, style_issues) = await static_analysis_turn(req.code)
+        messages = [
+            {"role": "system", "content": SYSTEM_DEBUG},
+            {"role": "user", "content": user_msg},
+            analysis_msg,
+        ]
+        result = {
             "static_analysis": {
                 "modules": modules,
                 "clock_domains": clocks,
                 "style_issues": style_issues
             }
         }
+        
+        if req.stream:
+            return sse_response(stream_gemini(messages, cache_namespace="debug",
+                                              max_tokens=MAX_OUTPUT_TOKENS["debug"]),
+                                result)
+        
+        reply = await call_gemini_with_retry(messages=messages, cache_namespace="debug",
+                                             max_tokens=MAX_OUTPUT_TOKENS["debug"])
+        return {"reply": reply, **result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -359,28 +674,32 @@ async def optimize(req: OptimizeRequest):
     try:
         constraints_text = ""
         if req.constraints:
-            constraints_text = f"Constraints: {json.dumps(req.constraints, indent=2)}"
+            try:
+                constraints_json = orjson.dumps(req.constraints, option=orjson.OPT_INDENT_2).decode()
+            except orjson.JSONEncodeError:
+                # orjson only handles 64-bit ints; the stdlib copes with anything valid JSON can hold
+                constraints_json = json.dumps(req.constraints, indent=2)
+            constraints_text = f"Constraints: {constraints_json}"
         
-        user_msg = f"""Optimize the following Verilog code for {req.target} implementation.
-Objective: {req.objective}
-{constraints_text}
-
-Provide:
-1. Current design analysis (area, timing, power estimates)
-2. Optimization opportunities
-3. Optimized code with detailed explanations
-4. Trade-off analysis
-5. Implementation recommendations
-
-Code:
-{req.code}"""
-
-        reply = await call_gemini_with_retry(
-            messages=[
-                {"role": "system", "content": SYSTEM_OPTIMIZE},
-                {"role": "user", "content": user_msg},
-            ]
+        user_msg = OPTIMIZE_TEMPLATE.format(
+            target=req.target,
+            objective=req.objective,
+            constraints_text=constraints_text,
+            code=req.code,
         )
+
+        messages = [
+            {"role": "system", "content": SYSTEM_OPTIMIZE},
+            {"role": "user", "content": user_msg},
+        ]
+        
+        if req.stream:
+            return sse_response(stream_gemini(messages, cache_namespace="optimize",
+                                              max_tokens=MAX_OUTPUT_TOKENS["optimize"]),
+                                {"optimization_target": req.objective})
+        
+        reply = await call_gemini_with_retry(messages=messages, cache_namespace="optimize",
+                                             max_tokens=MAX_OUTPUT_TOKENS["optimize"])
         return {"reply": reply, "optimization_target": req.objective}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -388,44 +707,35 @@ Code:
 @app.post("/testbench")
 async def generate_testbench(req: TestbenchRequest):
     try:
-        # Extract DUT information
-        analyzer = VerilogAnalyzer()
-        modules = analyzer.extract_modules(req.dut_code)
+        # Extract DUT information (off the event loop; regex scanning is CPU-bound).
+        # scan is memoized, so code already seen by /analyze or /debug is not rescanned
+        modules, _, _ = await asyncio.to_thread(VerilogAnalyzer.scan, req.dut_code)
         
         if not modules:
             raise HTTPException(status_code=400, detail="No modules found in DUT code")
         
-        dut_info = f"DUT modules: {[m['name'] for m in modules]}"
-        
-        user_msg = f"""Generate a comprehensive {req.language} testbench.
-
-DUT Analysis:
-{dut_info}
-
-Requirements:
-- Test type: {req.test_type}
-- Include coverage: {req.include_coverage}
-- Language: {req.language}
-
-Generate:
-1. Testbench architecture with proper interfaces
-2. Clock and reset generation
-3. Stimulus generation (directed + random)
-4. Self-checking mechanisms
-5. Coverage collection
-6. Performance metrics
-7. Test report generation
-
-DUT Code:
-{req.dut_code}"""
-
-        reply = await call_gemini_with_retry(
-            messages=[
-                {"role": "system", "content": SYSTEM_TESTBENCH},
-                {"role": "user", "content": user_msg},
-            ]
+        dut_modules = [m['name'] for m in modules]
+        user_msg = TESTBENCH_TEMPLATE.format(
+            language=req.language,
+            dut_modules=dut_modules,
+            test_type=req.test_type,
+            include_coverage=req.include_coverage,
+            dut_code=req.dut_code,
         )
-        return {"reply": reply, "dut_modules": [m['name'] for m in modules]}
+
+        messages = [
+            {"role": "system", "content": SYSTEM_TESTBENCH},
+            {"role": "user", "content": user_msg},
+        ]
+        
+        if req.stream:
+            return sse_response(stream_gemini(messages, cache_namespace="testbench",
+                                              max_tokens=MAX_OUTPUT_TOKENS["testbench"]),
+                                {"dut_modules": dut_modules})
+        
+        reply = await call_gemini_with_retry(messages=messages, cache_namespace="testbench",
+                                             max_tokens=MAX_OUTPUT_TOKENS["testbench"])
+        return {"reply": reply, "dut_modules": dut_modules}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -433,13 +743,16 @@ DUT Code:
 async def analyze_code(req: CodeRequest):
     """Comprehensive code analysis without modification"""
     try:
-        analyzer = VerilogAnalyzer()
-        modules = analyzer.extract_modules(req.code)
-        clocks = analyzer.analyze_clock_domains(req.code)
-        style_issues = analyzer.check_coding_style(req.code)
+        loc = VerilogAnalyzer.count_lines_of_code(req.code)
         
-        # Count lines of code
-        loc = len([line for line in req.code.split('\n') if line.strip()])
+        user_msg = ANALYZE_TEMPLATE.format(loc=loc, code=req.code)
+
+        analysis_msg, (modules, clocks, style_issues) = await static_analysis_turn(req.code)
+        messages = [
+            {"role": "system", "content": SYSTEM_ANALYZE},
+            {"role": "user", "content": user_msg},
+            analysis_msg,
+        ]
         
         analysis_summary = {
             "modules": len(modules),
@@ -447,36 +760,7 @@ async def analyze_code(req: CodeRequest):
             "lines_of_code": loc,
             "style_issues": len(style_issues)
         }
-        
-        user_msg = f"""Provide a comprehensive analysis of this Verilog code:
-
-Metrics:
-- Modules: {len(modules)}
-- Clock domains: {len(clocks)}
-- Lines of code: {loc}
-- Style issues: {len(style_issues)}
-
-Analysis areas:
-1. Design complexity and maintainability
-2. Synthesis implications and resource usage
-3. Timing considerations
-4. Power implications  
-5. Verification challenges
-6. Industry best practices compliance
-7. Portability across tools/vendors
-
-Code:
-{req.code}"""
-
-        reply = await call_gemini_with_retry(
-            messages=[
-                {"role": "system", "content": SYSTEM_BASE + "\nProvide detailed technical analysis without modifying the code."},
-                {"role": "user", "content": user_msg},
-            ]
-        )
-        
-        return {
-            "reply": reply,
+        result = {
             "metrics": analysis_summary,
             "details": {
                 "modules": modules,
@@ -484,48 +768,100 @@ Code:
                 "style_issues": style_issues
             }
         }
+        
+        if req.stream:
+            return sse_response(stream_gemini(messages, cache_namespace="analyze",
+                                              max_tokens=MAX_OUTPUT_TOKENS["analyze"]),
+                                result)
+        
+        reply = await call_gemini_with_retry(messages=messages, cache_namespace="analyze",
+                                             max_tokens=MAX_OUTPUT_TOKENS["analyze"])
+        return {"reply": reply, **result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/explain")
 async def explain(req: CodeRequest):
     try:
-        # Enhanced analysis for better explanations
-        analyzer = VerilogAnalyzer()
-        modules = analyzer.extract_modules(req.code)
-        clocks = analyzer.analyze_clock_domains(req.code)
+        # Line count via a C-level scan; no list of line strings is built
+        n_lines = req.code.count('\n') + 1
+        complexity = 'High' if n_lines > 100 else 'Medium' if n_lines > 50 else 'Low'
+        user_msg = EXPLAIN_TEMPLATE.format(analysis_depth=req.analysis_depth, complexity=complexity, code=req.code)
+
+        analysis_msg, (modules, _, _) = await static_analysis_turn(req.code)
+        messages = [
+            {"role": "system", "content": SYSTEM_EXPLAIN},
+            {"role": "user", "content": user_msg},
+            analysis_msg,
+        ]
+        result = {"context": {"modules": len(modules), "complexity": "analyzed"}}
         
-        context = f"""
-Code context:
-- Modules: {[m['name'] for m in modules]}
-- Clock domains: {clocks}
-- Complexity: {'High' if len(req.code.split('\n')) > 100 else 'Medium' if len(req.code.split('\n')) > 50 else 'Low'}
-"""
+        if req.stream:
+            return sse_response(stream_gemini(messages, cache_namespace="explain",
+                                              max_tokens=MAX_OUTPUT_TOKENS["explain"]),
+                                result)
         
-        user_msg = f"""Explain this Verilog code for a {req.analysis_depth} level understanding.
-
-{context}
-
-Structure your explanation:
-1. Overview and purpose
-2. Module interface (ports and parameters)
-3. Internal architecture
-4. Key design decisions
-5. Timing and clocking
-6. Reset methodology
-7. Potential applications
-8. Learning points for students
-
-Code:
-{req.code}"""
+        reply = await call_gemini_with_retry(messages=messages, cache_namespace="explain",
+                                             max_tokens=MAX_OUTPUT_TOKENS["explain"])
+        return {"reply": reply, **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        reply = await call_gemini_with_retry(
-            messages=[
-                {"role": "system", "content": SYSTEM_BASE + "\nProvide clear, educational explanations suitable for learning."},
-                {"role": "user", "content": user_msg},
-            ]
+@app.post("/full_review")
+async def full_review(req: CodeRequest):
+    """Analysis, debug and optimization reviews in one round trip"""
+    if req.stream:
+        # Three replies can't be interleaved into one SSE stream; stream the endpoints individually instead
+        raise HTTPException(status_code=400, detail="/full_review does not support streaming")
+    try:
+        loc = VerilogAnalyzer.count_lines_of_code(req.code)
+        analysis_msg, (modules, clocks, style_issues) = await static_analysis_turn(req.code)
+        
+        # Prompts match /analyze, /debug and /optimize (with default target/objective),
+        # so replies are shared with those endpoints through the response cache
+        analyze_messages = [
+            {"role": "system", "content": SYSTEM_ANALYZE},
+            {"role": "user", "content": ANALYZE_TEMPLATE.format(loc=loc, code=req.code)},
+            analysis_msg,
+        ]
+        debug_messages = [
+            {"role": "system", "content": SYSTEM_DEBUG},
+            {"role": "user", "content": DEBUG_TEMPLATE.format(analysis_depth=req.analysis_depth, code=req.code)},
+            analysis_msg,
+        ]
+        optimize_messages = [
+            {"role": "system", "content": SYSTEM_OPTIMIZE},
+            {"role": "user", "content": OPTIMIZE_TEMPLATE.format(
+                target="fpga", objective="balanced", constraints_text="", code=req.code)},
+        ]
+        
+        # All three Gemini calls are in flight at once (multiplexed over the shared HTTP/2 client),
+        # so wall time is the slowest call rather than the sum
+        analysis, debug_reply, optimization = await asyncio.gather(
+            call_gemini_with_retry(messages=analyze_messages, cache_namespace="analyze",
+                                   max_tokens=MAX_OUTPUT_TOKENS["analyze"]),
+            call_gemini_with_retry(messages=debug_messages, cache_namespace="debug",
+                                   max_tokens=MAX_OUTPUT_TOKENS["debug"]),
+            call_gemini_with_retry(messages=optimize_messages, cache_namespace="optimize",
+                                   max_tokens=MAX_OUTPUT_TOKENS["optimize"]),
         )
-        return {"reply": reply, "context": {"modules": len(modules), "complexity": "analyzed"}}
+        
+        return {
+            "analysis": analysis,
+            "debug": debug_reply,
+            "optimization": optimization,
+            "metrics": {
+                "modules": len(modules),
+                "clock_domains": len(clocks),
+                "lines_of_code": loc,
+                "style_issues": len(style_issues)
+            },
+            "static_analysis": {
+                "modules": modules,
+                "clock_domains": clocks,
+                "style_issues": style_issues
+            }
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -536,22 +872,47 @@ async def upload_file(file: UploadFile = File(...)):
         if not file.filename.endswith(('.v', '.sv', '.vh', '.svh')):
             raise HTTPException(status_code=400, detail="Only Verilog files (.v, .sv, .vh, .svh) are supported")
         
-        content = await file.read()
-        code = content.decode('utf-8')
+        # Starlette has already spooled the body by now (limit_request_body is what stops
+        # large requests early); these checks just keep oversized files out of the decoder
+        if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit")
+        
+        # Decode in chunks so the raw bytes are never held in memory in full
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        parts = []
+        size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit")
+            parts.append(decoder.decode(chunk))
+        parts.append(decoder.decode(b"", final=True))
+        code = "".join(parts)
         
-        # Basic analysis of uploaded file
-        analyzer = VerilogAnalyzer()
-        modules = analyzer.extract_modules(code)
+        # Basic analysis of uploaded file (off the event loop; regex scanning is CPU-bound).
+        # Going through the memoized scan means follow-up requests on this code hit its cache
+        modules, _, _ = await asyncio.to_thread(VerilogAnalyzer.scan, code)
         
         return {
             "filename": file.filename,
-            "size": len(content),
+            "size": size,
             "modules": [m['name'] for m in modules],
             "preview": code[:500] + "..." if len(code) > 500 else code
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # uvloop and httptools ship with uvicorn[standard]; uvloop has no Windows build.
+    # Each worker is its own process with its own lifespan, so the shared client stays per-worker.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=SERVER_WORKERS,
+    )
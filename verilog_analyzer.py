@@ -0,0 +1,117 @@
+# verilog_analyzer.py
+import re
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Tuple
+
+ANALYSIS_CACHE_SIZE = 256
+
+# ========= Enhanced Verilog Analysis Functions =========
+def _memoize_by_code(func):
+    """LRU-memoize a tuple of analysis results on a digest of the code, so the same
+    source sent to several endpoints is only analyzed once (the code itself is not retained)"""
+    cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+    lock = threading.Lock()
+
+    @functools.wraps(func)
+    def wrapper(code: str) -> tuple:
+        key = hashlib.blake2b(code.encode(), digest_size=16).digest()
+        with lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return tuple(list(part) for part in cache[key])
+        result = func(code)
+        with lock:
+            cache[key] = result
+            if len(cache) > ANALYSIS_CACHE_SIZE:
+                cache.popitem(last=False)
+        return tuple(list(part) for part in result)
+
+    return wrapper
+
+class VerilogAnalyzer:
+    # Patterns are compiled once at class load rather than on every call
+    _MODULE_RE = re.compile(r'module\s+(\w+)\s*(?:#\([^)]*\))?\s*\(([^;]*)\);', re.MULTILINE | re.DOTALL)
+    # Common clock patterns (always_ff @(posedge|negedge x), always @(posedge x)) in one alternation
+    _CLOCK_RE = re.compile(r'always(?:_ff\s*@\s*\(\s*(?:posedge|negedge)|\s*@\s*\(\s*posedge)\s+(\w+)')
+    _MAGIC_NUM_RE = re.compile(r'\b\d{2,}\b')
+    # Cheap superset of what check_coding_style can flag; lines without a hit are never visited
+    _STYLE_RE = re.compile(r'always|\d\d')
+
+    @staticmethod
+    def extract_modules(code: str) -> List[Dict[str, str]]:
+        """Extract module information from Verilog code"""
+        modules = []
+        matches = VerilogAnalyzer._MODULE_RE.finditer(code)
+        
+        for match in matches:
+            modules.append({
+                'name': match.group(1),
+                'ports': match.group(2).strip(),
+                'start_pos': match.start(),
+                'end_pos': match.end()
+            })
+        return modules
+
+    @staticmethod
+    def analyze_clock_domains(code: str) -> List[str]:
+        """Identify clock domains in the code"""
+        clock_signals = set(VerilogAnalyzer._CLOCK_RE.findall(code))
+        return list(clock_signals)
+
+    @staticmethod
+    def check_coding_style(code: str) -> List[Dict[str, str]]:
+        """Check for coding style violations"""
+        issues = []
+        search = VerilogAnalyzer._STYLE_RE.search
+        magic_num = VerilogAnalyzer._MAGIC_NUM_RE.search
+        i, line_start = 1, 0
+        
+        # Single scan over the whole buffer, jumping from one candidate line to the next
+        match = search(code)
+        while match:
+            pos = match.start()
+            i += code.count('\n', line_start, pos)
+            line_start = code.rfind('\n', 0, pos) + 1
+            line_end = code.find('\n', pos)
+            if line_end == -1:
+                line_end = len(code)
+            line = code[line_start:line_end]
+            
+            # Check for blocking assignments in sequential blocks
+            if 'always_ff' in line or 'always @(posedge' in line:
+                if '=' in line and '<=' not in line and '//' not in line.split('=')[0]:
+                    issues.append({
+                        'type': 'warning',
+                        'line': i,
+                        'message': 'Consider using non-blocking assignment (<=) in sequential logic'
+                    })
+            
+            # Check for magic numbers (cheap substring tests first, regex last)
+            if 'parameter' not in line and '//' not in line and magic_num(line):
+                issues.append({
+                    'type': 'info',
+                    'line': i,
+                    'message': 'Consider using parameters for numeric constants'
+                })
+            
+            match = search(code, line_end + 1)
+        
+        return issues
+
+    @staticmethod
+    def count_lines_of_code(code: str) -> int:
+        """Count non-blank lines"""
+        return len([line for line in code.split('\n') if line.strip()])
+
+    @staticmethod
+    @_memoize_by_code
+    def scan(code: str) -> Tuple[List[Dict[str, str]], List[str], List[Dict[str, str]]]:
+        """Run every analysis pass in one call (one worker-thread hop for async callers)"""
+        return (
+            VerilogAnalyzer.extract_modules(code),
+            VerilogAnalyzer.analyze_clock_domains(code),
+            VerilogAnalyzer.check_coding_style(code),
+        )